@@ -20,35 +20,28 @@
 作者: Augment Agent
 """
 
-import os
 import sys
+import shutil
+import functools
 import subprocess
-import tempfile
 from pathlib import Path
 
 
+@functools.lru_cache(maxsize=1)
 def check_ffmpeg():
-    """检查 ffmpeg 是否可用"""
-    try:
-        subprocess.run(['ffmpeg', '-version'], 
-                      stdout=subprocess.DEVNULL, 
-                      stderr=subprocess.DEVNULL, 
-                      check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    """检查 ffmpeg 是否可用（只在 PATH 中查找，不启动进程）"""
+    return shutil.which('ffmpeg') is not None
 
 
-def convert_mp3_to_pcm(mp3_path, output_path):
+def convert_mp3_to_pcm(mp3_path):
     """
     使用 ffmpeg 将 MP3 转换为 16kHz 单声道 16位 PCM 格式
     
     Args:
         mp3_path: 输入的 MP3 文件路径
-        output_path: 输出的 PCM 文件路径
     
     Returns:
-        bool: 转换是否成功
+        bytes: PCM 数据，转换失败返回 None
     """
     try:
         cmd = [
@@ -57,32 +50,30 @@ def convert_mp3_to_pcm(mp3_path, output_path):
             '-ar', '16000',                # 采样率 16kHz
             '-ac', '1',                    # 单声道
             '-f', 's16le',                 # 16位小端格式
-            '-y',                          # 覆盖输出文件
-            str(output_path)               # 输出文件
+            'pipe:1'                       # 输出到标准输出，不产生临时文件
         ]
         
         result = subprocess.run(cmd, 
-                              stdout=subprocess.DEVNULL, 
-                              stderr=subprocess.PIPE, 
-                              text=True)
+                              stdout=subprocess.PIPE, 
+                              stderr=subprocess.PIPE)
         
         if result.returncode != 0:
-            print(f"❌ ffmpeg 转换失败: {result.stderr}")
-            return False
+            print(f"❌ ffmpeg 转换失败: {result.stderr.decode('utf-8', 'ignore')}")
+            return None
             
-        return True
+        return result.stdout
         
     except Exception as e:
         print(f"❌ 转换过程中发生错误: {e}")
-        return False
+        return None
 
 
-def pcm_to_c_header(pcm_path, header_path, array_name):
+def pcm_to_c_header(pcm_data, header_path, array_name):
     """
-    将 PCM 文件转换为 C 头文件格式
+    将 PCM 数据转换为 C 头文件格式
     
     Args:
-        pcm_path: PCM 文件路径
+        pcm_data: PCM 数据
         header_path: 输出的头文件路径
         array_name: C 数组名称
     
@@ -90,12 +81,8 @@ def pcm_to_c_header(pcm_path, header_path, array_name):
         bool: 转换是否成功
     """
     try:
-        # 读取 PCM 数据
-        with open(pcm_path, 'rb') as f:
-            pcm_data = f.read()
-        
         if len(pcm_data) == 0:
-            print(f"❌ PCM 文件为空: {pcm_path}")
+            print(f"❌ PCM 数据为空: {header_path}")
             return False
         
         # 生成 C 头文件内容
@@ -147,28 +134,17 @@ def convert_audio_file(mp3_path, output_dir):
     
     print(f"🔄 正在转换: {mp3_path.name}")
     
-    # 创建临时 PCM 文件
-    with tempfile.NamedTemporaryFile(suffix='.pcm', delete=False) as temp_pcm:
-        temp_pcm_path = temp_pcm.name
+    # 第一步：MP3 转 PCM（通过管道直接读取，不写临时文件）
+    pcm_data = convert_mp3_to_pcm(mp3_path)
+    if pcm_data is None:
+        return False
+    
+    # 第二步：PCM 转 C 头文件
+    if not pcm_to_c_header(pcm_data, header_path, array_name):
+        return False
     
-    try:
-        # 第一步：MP3 转 PCM
-        if not convert_mp3_to_pcm(mp3_path, temp_pcm_path):
-            return False
-        
-        # 第二步：PCM 转 C 头文件
-        if not pcm_to_c_header(temp_pcm_path, header_path, array_name):
-            return False
-        
-        print(f"✅ 转换完成: {mp3_path.name} -> {header_path.name}")
-        return True
-        
-    finally:
-        # 清理临时文件
-        try:
-            os.unlink(temp_pcm_path)
-        except:
-            pass
+    print(f"✅ 转换完成: {mp3_path.name} -> {header_path.name}")
+    return True
 
 
 def main():
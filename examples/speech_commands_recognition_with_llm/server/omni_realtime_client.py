@@ -3,13 +3,61 @@
 import asyncio
 import websockets
 import json
-import base64
+import binascii
 import os
+import itertools
+import concurrent.futures
+import logging
 import time
 
 from typing import Optional, Callable, List, Dict, Any
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
+# Prefer orjson (C implementation) for JSON encoding/decoding, fall back to stdlib
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    json_loads = orjson.loads
+
+except ImportError:
+    json_dumps = json.dumps
+    json_loads = json.loads
+
+# Prefer pybase64 (SIMD-accelerated) for encoding/decoding audio, fall back to stdlib
+# (binascii is the C codec underneath the base64 module, minus its wrappers)
+try:
+    from pybase64 import b64decode, b64encode_as_string
+except ImportError:
+    from binascii import a2b_base64 as b64decode
+
+    def b64encode_as_string(data: bytes) -> str:
+        return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+
+# Pre-built JSON fragments of the input_audio_buffer.append event, so streaming
+# audio needs neither a dict nor the JSON encoder (base64 needs no escaping)
+_AUDIO_APPEND_PREFIX = '{"event_id":"'
+_AUDIO_APPEND_MIDDLE = '","type":"input_audio_buffer.append","audio":"'
+_AUDIO_APPEND_SUFFIX = '"}'
+
+# Outgoing audio is sent once this many bytes (~64 ms of 16 kHz PCM) are
+# buffered, or once this many seconds have passed since the last send
+_AUDIO_SEND_BATCH_BYTES = 2048
+_AUDIO_SEND_INTERVAL = 0.04
+
+# Audio deltas arriving within this window (seconds) are merged and handed to
+# on_audio_delta in one call
+_AUDIO_DELTA_FLUSH_DELAY = 0.005
+
+# Numbers each client instance, so sessions created in the same second (e.g. a
+# prewarmed session replacing the previous one) still get distinct event ids
+_session_ids = itertools.count(1)
+
 
 class TurnDetectionMode(Enum):
     SERVER_VAD = "server_vad"
@@ -34,6 +82,7 @@ class OmniRealtimeClient:
         on_text_delta: Optional[Callable[[str], None]] = None,
         on_audio_delta: Optional[Callable[[bytes], None]] = None,
         on_interrupt: Optional[Callable[[], None]] = None,
+        on_response_done: Optional[Callable[[], None]] = None,
         on_input_transcript: Optional[Callable[[str], None]] = None,
         on_output_transcript: Optional[Callable[[str], None]] = None,
         extra_event_handlers: Optional[
@@ -49,22 +98,52 @@ class OmniRealtimeClient:
         self.on_text_delta = on_text_delta
         self.on_audio_delta = on_audio_delta
         self.on_interrupt = on_interrupt
+        self.on_response_done = on_response_done
         self.on_input_transcript = on_input_transcript
         self.on_output_transcript = on_output_transcript
         self.turn_detection_mode = turn_detection_mode
         self.extra_event_handlers = extra_event_handlers or {}
         self.enable_verbose_logging = enable_verbose_logging
+        # Per-event logs go out at INFO for a verbose client and at DEBUG
+        # otherwise; the logger's own level is left to the application
+        self._event_log_level = (
+            logging.INFO if enable_verbose_logging else logging.DEBUG
+        )
 
         # Track current response state
         self._current_response_id = None
         self._current_item_id = None
         self._is_responding = False
+        self._interrupt_task = None
         # Track printing state for input and output transcripts
         self._print_input_transcript = False
         self._output_transcript_buffer = ""
         # Cache system prompt
         self._system_prompt = None
         
+        # Monotonic event id counter: unique even for events sent within the
+        # same millisecond, and cheaper than formatting a timestamp. The
+        # prefix is built once; the process id and per-instance session number
+        # keep ids distinct across sessions, even ones created in one second.
+        self._event_ids = itertools.count(1)
+        self._event_id_prefix = (
+            f"event_{int(time.time())}_{os.getpid()}_{next(_session_ids)}_"
+        )
+
+        # Transcript callbacks run in order on one worker thread, fed by a
+        # queue, so the message reader never waits for them
+        self._callback_queue = None
+        self._callback_task = None
+        self._callback_executor = None
+
+        # Outgoing audio waiting to be batched into one append event
+        self._audio_send_buffer = bytearray()
+        self._last_audio_send = time.monotonic()
+
+        # Decoded audio deltas waiting to be passed to on_audio_delta
+        self._audio_delta_buffer = bytearray()
+        self._audio_flush_handle = None
+
         # 收集完整的响应文本
         self._response_text_buffer = ""
         self._input_text_buffer = ""
@@ -101,13 +180,23 @@ class OmniRealtimeClient:
         print(f"   模型: {self.model}")
         print(f"   API Key: {masked_key}")
 
+        # Audio payloads are base64 PCM, so permessage-deflate only costs CPU.
+        # A deeper receive queue absorbs bursts of audio deltas without
+        # pausing reads from the socket, and a larger frame limit keeps a
+        # long base64 audio delta from closing the connection.
+        connect_kwargs = {"compression": None, "max_queue": 128, "max_size": 2**22}
+
         # For compatibility with different websockets versions
         try:
             # Try newer websockets API first
-            self.ws = await websockets.connect(url, additional_headers=headers)
+            self.ws = await websockets.connect(
+                url, additional_headers=headers, **connect_kwargs
+            )
         except TypeError:
             # Fallback to older API that uses extra_headers
-            self.ws = await websockets.connect(url, extra_headers=headers)
+            self.ws = await websockets.connect(
+                url, extra_headers=headers, **connect_kwargs
+            )
 
         # Set up default session configuration
         if self.turn_detection_mode == TurnDetectionMode.MANUAL:
@@ -140,6 +229,23 @@ class OmniRealtimeClient:
         else:
             raise ValueError(f"Invalid turn detection mode: {self.turn_detection_mode}")
 
+        if self.on_input_transcript or self.on_output_transcript:
+            self._callback_queue = asyncio.Queue()
+            self._callback_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1
+            )
+            self._callback_task = asyncio.create_task(self._run_callbacks())
+
+    async def _run_callbacks(self) -> None:
+        """Run queued transcript callbacks one at a time off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            callback, arg = await self._callback_queue.get()
+            try:
+                await loop.run_in_executor(self._callback_executor, callback, arg)
+            except Exception as e:
+                print("❌ 回调处理错误: ", str(e))
+
     def _mask_api_key(self, api_key: str) -> str:
         """隐藏API Key的中间部分"""
         if not api_key or len(api_key) < 8:
@@ -147,13 +253,16 @@ class OmniRealtimeClient:
         return f"{api_key[:4]}...{api_key[-4:]}"
 
     async def send_event(self, event) -> None:
-        event["event_id"] = "event_" + str(int(time.time() * 1000))
+        event["event_id"] = self._event_id_prefix + str(next(self._event_ids))
         
-        # 只在详细模式下打印发送的事件
-        if self.enable_verbose_logging:
-            print(f"📤 Send event: type={event['type']}, event_id={event['event_id']}")
+        # 只在详细模式（或应用开启DEBUG日志）时输出发送的事件
+        logger.log(self._event_log_level, "📤 Send event: type=%s, event_id=%s", event["type"], event["event_id"])
         
-        await self.ws.send(json.dumps(event))
+        await self.send_raw(json_dumps(event))
+
+    async def send_raw(self, payload: str) -> None:
+        """Send an already serialized JSON event as a text frame."""
+        await self.ws.send(payload)
 
     async def update_session(self, config: Dict[str, Any]) -> None:
         """Update session configuration."""
@@ -165,12 +274,36 @@ class OmniRealtimeClient:
         await self.send_event(event)
 
     async def stream_audio(self, audio_chunk: bytes) -> None:
-        """Stream raw audio data to the API."""
+        """Stream raw audio data to the API.
+
+        Small chunks are buffered and sent as one append event, so the base64,
+        JSON and send overhead is paid per batch instead of per chunk. Call
+        flush_audio() at the end of an utterance to send the remainder.
+        """
         # only support 16bit 16kHz mono pcm
-        audio_b64 = base64.b64encode(audio_chunk).decode()
+        self._audio_send_buffer += audio_chunk
+        if (
+            len(self._audio_send_buffer) >= _AUDIO_SEND_BATCH_BYTES
+            or time.monotonic() - self._last_audio_send > _AUDIO_SEND_INTERVAL
+        ):
+            await self.flush_audio()
+
+    async def flush_audio(self) -> None:
+        """Send all buffered audio to the API as a single append event."""
+        self._last_audio_send = time.monotonic()
+        if not self._audio_send_buffer:
+            return
 
-        append_event = {"type": "input_audio_buffer.append", "audio": audio_b64}
-        await self.send_event(append_event)
+        audio_b64 = b64encode_as_string(self._audio_send_buffer)
+        self._audio_send_buffer.clear()
+        event_id = self._event_id_prefix + str(next(self._event_ids))
+        await self.send_raw(
+            _AUDIO_APPEND_PREFIX
+            + event_id
+            + _AUDIO_APPEND_MIDDLE
+            + audio_b64
+            + _AUDIO_APPEND_SUFFIX
+        )
 
     async def create_response(self) -> None:
         """Request a response from the API. Needed when using manual mode."""
@@ -199,23 +332,44 @@ class OmniRealtimeClient:
 
         print("⚡ 处理中断")
 
-        # 1. Cancel the current response
-        if self._current_response_id:
-            await self.cancel_response()
-
+        # Clear the response state before the first await, so an interruption
+        # that arrives while the cancel is in flight does not cancel again
+        response_id = self._current_response_id
         self._is_responding = False
         self._current_response_id = None
         self._current_item_id = None
 
+        # Cancel the current response
+        if response_id:
+            await self.cancel_response()
+
+    def _on_interrupt_done(self, task: asyncio.Task) -> None:
+        """Report an error from a background interruption, e.g. a closed socket."""
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc:
+            print("❌ 中断处理错误: ", str(exc))
+
+    def _flush_audio_delta(self) -> None:
+        """Pass the buffered audio deltas to on_audio_delta in one call."""
+        if self._audio_flush_handle:
+            self._audio_flush_handle.cancel()
+            self._audio_flush_handle = None
+        if self._audio_delta_buffer:
+            audio_bytes = bytes(self._audio_delta_buffer)
+            self._audio_delta_buffer.clear()
+            self.on_audio_delta(audio_bytes)
+
     async def handle_messages(self) -> None:
         try:
             async for message in self.ws:
-                event = json.loads(message)
+                event = json_loads(message)
                 event_type = event.get("type")
 
-                # 只在详细模式下打印所有事件
-                if self.enable_verbose_logging and event_type != "response.audio.delta":
-                    print(f"📥 event: {event_type}")
+                # 只在详细模式（或应用开启DEBUG日志）时输出所有事件
+                if event_type != "response.audio.delta":
+                    logger.log(self._event_log_level, "📥 event: %s", event_type)
 
                 if event_type == "error":
                     print("❌ Error: ", event["error"])
@@ -228,6 +382,8 @@ class OmniRealtimeClient:
                 elif event_type == "response.output_item.added":
                     self._current_item_id = event.get("item", {}).get("id")
                 elif event_type == "response.done":
+                    if self.on_audio_delta:
+                        self._flush_audio_delta()
                     self._is_responding = False
                     self._current_response_id = None
                     self._current_item_id = None
@@ -238,19 +394,30 @@ class OmniRealtimeClient:
                         self._response_text_buffer = ""
                     
                     print("✅ 响应生成完成")
+
+                    # Runs after the last audio delta was flushed above, so
+                    # the callback sees every delta of this response first
+                    if self.on_response_done:
+                        self.on_response_done()
                 # Handle interruptions
                 elif event_type == "input_audio_buffer.speech_started":
-                    if self.enable_verbose_logging:
-                        print("🎤 检测到语音开始")
+                    logger.log(self._event_log_level, "🎤 检测到语音开始")
+                    if self.on_audio_delta:
+                        self._flush_audio_delta()
                     if self._is_responding:
-                        print("⚡ 触发中断处理")
-                        await self.handle_interruption()
+                        # Send the cancel in the background so the reader
+                        # keeps draining events meanwhile
+                        self._interrupt_task = asyncio.create_task(
+                            self.handle_interruption()
+                        )
+                        self._interrupt_task.add_done_callback(
+                            self._on_interrupt_done
+                        )
 
                     if self.on_interrupt:
                         self.on_interrupt()
                 elif event_type == "input_audio_buffer.speech_stopped":
-                    if self.enable_verbose_logging:
-                        print("🔇 检测到语音结束")
+                    logger.log(self._event_log_level, "🔇 检测到语音结束")
                 # Handle normal response events
                 elif event_type == "response.text.delta":
                     if self.on_text_delta:
@@ -259,8 +426,15 @@ class OmniRealtimeClient:
                         self.on_text_delta(delta_text)
                 elif event_type == "response.audio.delta":
                     if self.on_audio_delta:
-                        audio_bytes = base64.b64decode(event["delta"])
-                        self.on_audio_delta(audio_bytes)
+                        # Merge deltas that arrive close together, so the
+                        # callback runs once per burst instead of per event
+                        self._audio_delta_buffer += b64decode(event["delta"])
+                        if self._audio_flush_handle is None:
+                            self._audio_flush_handle = (
+                                asyncio.get_running_loop().call_later(
+                                    _AUDIO_DELTA_FLUSH_DELAY, self._flush_audio_delta
+                                )
+                            )
                 elif (
                     event_type
                     == "conversation.item.input_audio_transcription.completed"
@@ -269,7 +443,9 @@ class OmniRealtimeClient:
                     if transcript:
                         print(f"\n🗣️ 用户说: {transcript}\n")
                     if self.on_input_transcript:
-                        await asyncio.to_thread(self.on_input_transcript, transcript)
+                        self._callback_queue.put_nowait(
+                            (self.on_input_transcript, transcript)
+                        )
                         self._print_input_transcript = True
                 elif event_type == "response.audio_transcript.delta":
                     # 不在这里输出，收集到response.done时再输出
@@ -279,12 +455,16 @@ class OmniRealtimeClient:
                             self._output_transcript_buffer += delta
                         else:
                             if self._output_transcript_buffer:
-                                await asyncio.to_thread(
-                                    self.on_output_transcript,
-                                    self._output_transcript_buffer,
+                                self._callback_queue.put_nowait(
+                                    (
+                                        self.on_output_transcript,
+                                        self._output_transcript_buffer,
+                                    )
                                 )
                                 self._output_transcript_buffer = ""
-                            await asyncio.to_thread(self.on_output_transcript, delta)
+                            self._callback_queue.put_nowait(
+                                (self.on_output_transcript, delta)
+                            )
                 elif event_type == "response.audio_transcript.done":
                     self._print_input_transcript = False
                 elif event_type in self.extra_event_handlers:
@@ -297,5 +477,12 @@ class OmniRealtimeClient:
 
     async def close(self) -> None:
         """Close the WebSocket connection."""
+        # Deliver audio deltas still waiting for the merge window instead of
+        # dropping them (this also cancels the pending flush)
+        self._flush_audio_delta()
+        if self._callback_task:
+            self._callback_task.cancel()
+            self._callback_task = None
+            self._callback_executor.shutdown(wait=False)
         if self.ws:
             await self.ws.close()
\ No newline at end of file
@@ -8,7 +8,10 @@
 
 🎮 快速开始（3步搞定）：
    第1步：安装依赖
-   pip install websockets pydub asyncio numpy scipy
+   pip install websockets asyncio numpy scipy
+   并确保系统已安装ffmpeg（用于把录音保存为MP3）
+   （可选）pip install uvloop  # Linux/macOS下更快的事件循环
+   （可选）pip install lameenc  # 进程内编码MP3，安装后不再需要ffmpeg
 
    第2步：设置API密钥（二选一）
    方法A（推荐）：export DASHSCOPE_API_KEY='你的密钥'
@@ -59,14 +62,16 @@
 import os
 import sys
 import json
-import base64
-import wave
+import logging
 import asyncio
+import subprocess
 import websockets
-from datetime import datetime
-from pydub import AudioSegment
 import time
 import socket
+import itertools
+import math
+import functools
+import numpy as np
 
 # 尝试导入服务器版本的客户端，如果没有则使用原版
 from omni_realtime_client import (
@@ -76,16 +81,78 @@ from omni_realtime_client import (
 
 OMNI_CLIENT_AVAILABLE = True
 
+# 📝 日志：逐块音频日志使用DEBUG级别，默认INFO级别下不会格式化也不会输出
+logger = logging.getLogger(__name__)
+
+# 🔄 尝试导入scipy用于高质量重采样，不可用时退回到简单的线性插值
+try:
+    from scipy import signal
+
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# 📦 尝试使用orjson（C实现，解析速度是标准库的数倍），不可用时使用标准库json
+# 💡 orjson.JSONDecodeError是json.JSONDecodeError的子类，异常处理无需修改
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# ⚡ 尝试使用uvloop（基于libuv的高性能事件循环），不可用时使用默认事件循环
+try:
+    import uvloop
+
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+# ⚡ 尝试使用lameenc在进程内编码MP3，不可用时调用ffmpeg
+try:
+    import lameenc
+
+    LAMEENC_AVAILABLE = True
+except ImportError:
+    LAMEENC_AVAILABLE = False
+
 # 🎵 音频参数配置
 SAMPLE_RATE = 16000  # ESP32使用的采样率 16kHz
 MODEL_SAMPLE_RATE = 24000  # 大模型输出的采样率 24kHz
 CHANNELS = 1  # 单声道（节省带宽，语音识别不需要立体声）
 BIT_DEPTH = 16  # 16位深度（CD音质标准）
 BYTES_PER_SAMPLE = 2  # 16位 = 2字节
+INT16_MIN = -32768  # 16位PCM的取值范围
+INT16_MAX = 32767
 
 # 🌐 WebSocket服务器配置
 WS_HOST = "0.0.0.0"  # 监听所有网络接口（允许局域网访问）
 WS_PORT = 8888  # WebSocket端口（确保防火墙允许此端口）
+WS_MAX_MESSAGE_SIZE = 2**22  # 单条消息最大4MB
+WS_MAX_QUEUE = 32  # 最多缓存的未处理消息数，处理不过来时对ESP32施加背压
+WS_WRITE_LIMIT = 2**18  # 发送缓冲区上限256KB（16kHz约8秒音频），超过时send才等待网络发送
+
+# 📮 模型音频发送配置
+AUDIO_BATCH_BYTES = 4800  # 每次重采样并发送的最大字节数（24kHz下约100ms）
+# ESP32一边接收一边阻塞地写I2S，读取速度等于播放速度，长回复时服务器积压音频是正常现象；
+# 积压的音频只会延后发送。只有send超过这个时间毫无进展（ESP32卡死）时才丢弃音频并断开连接
+AUDIO_SEND_STALL_TIMEOUT = 10
+# 发送缓冲上限（防止ESP32卡死时内存无限增长，不是正常的限流手段）：
+# 正常读取的ESP32积压量不会超过一次回复的总时长，大模型单次语音回复远短于5分钟，
+# 所以只有ESP32停止读取时才会触达上限。按时长计算，与大模型如何切分音频片段无关。
+# 缓冲中是重采样前的24kHz音频，300秒约14MB；发给ESP32时对应300秒16kHz音频
+AUDIO_BUFFER_MAX_SECONDS = 300
+AUDIO_BUFFER_MAX_BYTES = AUDIO_BUFFER_MAX_SECONDS * MODEL_SAMPLE_RATE * BYTES_PER_SAMPLE
+
+# ⏳ 等待模型响应配置
+RESPONSE_IDLE_TIMEOUT = 2.0  # 兜底：收不到response.done时，超过2秒没有新音频也认为响应结束
+RESPONSE_MAX_WAIT = 30  # 超时保护，最多等待30秒
+
+# 💾 录音保存队列配置
+SAVE_QUEUE_SIZE = 4  # 最多排队等待编码的录音数（满了就丢弃，保证实时音频优先）
+# 是否保存用户录音（设置环境变量 XZ_ARCHIVE=0 关闭，关闭后不再缓存录音数据）
+ARCHIVE_USER_AUDIO = os.environ.get("XZ_ARCHIVE", "1") == "1"
 
 # 💡 新手提示：
 # - 采样率越高，音质越好，但数据量也越大
@@ -93,6 +160,178 @@ WS_PORT = 8888  # WebSocket端口（确保防火墙允许此端口）
 # - 24kHz是大模型生成的高质量音频
 
 
+@functools.lru_cache(maxsize=None)
+def design_resample_filter(up, down):
+    """
+    🎛️ 设计多相重采样使用的低通FIR滤波器
+
+    参数：
+        up: 上采样倍数
+        down: 下采样倍数
+
+    返回：
+        numpy.ndarray: float32滤波器系数
+
+    💡 结果会被缓存，每种采样率比例只计算一次，
+    避免每个音频块都重新设计滤波器
+    """
+    # 与scipy.signal.resample_poly的默认设计一致：
+    # 截止频率取两个采样率中较低的奈奎斯特频率，Kaiser窗
+    max_rate = max(up, down)
+    taps = signal.firwin(20 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    return taps.astype(np.float32)
+
+
+class StreamingResampler:
+    """
+    🔁 流式重采样器
+
+    大模型的音频是一段一段返回的，如果每段单独重采样，
+    每段的边缘都会因为滤波器"从零开始"而产生咔哒声。
+    这个类在相邻音频块之间保留滤波器状态，效果等同于对整段音频一次性重采样。
+
+    算法（多相实现）：
+        等价于"样本之间插(up-1)个0 → 低通FIR滤波 → 每down个样本取一个"，
+        但插入的0对结果没有贡献，被丢弃的样本也不需要计算。
+        因此把滤波器按相位拆成up个短滤波器，每个输出样本只用对应相位的
+        短滤波器和原始样本做一次点积，计算量约为直接滤波的1/(up*down)。
+
+    💡 每次对话创建一个新的实例，对话之间互不影响
+    """
+
+    def __init__(self, from_rate, to_rate):
+        divisor = math.gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+
+        # 滤波器系数乘以up，补偿插0带来的幅度损失
+        taps = design_resample_filter(self.up, self.down) * self.up
+
+        # 拆成up个相位的短滤波器：第r行对应 taps[r], taps[r+up], taps[r+2*up]...
+        # 系数倒序排列，这样可以直接和按时间顺序排列的样本窗口做点积
+        self._taps_per_phase = -(-len(taps) // self.up)
+        padded = np.zeros(self._taps_per_phase * self.up, dtype=np.float32)
+        padded[: len(taps)] = taps
+        self._polyphase = np.ascontiguousarray(
+            padded.reshape(self._taps_per_phase, self.up).T[:, ::-1]
+        )
+
+        # 上一块末尾的样本（滤波器状态），初始为0
+        self._history = np.zeros(self._taps_per_phase - 1, dtype=np.float32)
+        self._phase = 0  # 下一个输出样本在本块上采样序列中的位置
+        self._carry = b""  # 上一块末尾不足一个样本的字节（奇数长度时），拼到下一块开头
+
+        # 工作缓冲区：重复使用，避免每个音频块都分配新的数组
+        self._input = np.empty(0, dtype=np.float32)
+        self._scratch = np.empty(0, dtype=np.float32)
+        self._output = np.empty(4096, dtype=np.int16)
+
+    def process(self, audio_data):
+        """
+        重采样一个音频块
+
+        参数：
+            audio_data: 16位PCM音频数据（字节）
+
+        返回：
+            memoryview: 重采样后的16位PCM音频数据（可直接用websocket.send发送）
+
+        ⚠️ 返回值指向内部缓冲区，下次调用process后内容会被覆盖，
+        需要保存时请先用bytes()复制
+        """
+        # 半个样本（奇数字节）留到下一块，凑成完整样本后再处理
+        if self._carry:
+            audio_data = self._carry + bytes(audio_data)
+            self._carry = b""
+        if len(audio_data) % BYTES_PER_SAMPLE:
+            self._carry = bytes(audio_data[-1:])
+            audio_data = memoryview(audio_data)[:-1]
+        if len(audio_data) == 0:
+            return memoryview(b"")
+
+        samples = np.frombuffer(audio_data, dtype=np.int16)
+        num_samples = len(samples)
+        history_len = len(self._history)
+
+        # 拼接上一块末尾的样本和本块样本，并保留新的末尾样本给下一块
+        input_len = history_len + num_samples
+        if len(self._input) < input_len:
+            self._input = np.empty(input_len, dtype=np.float32)
+        extended = self._input[:input_len]
+        extended[:history_len] = self._history
+        extended[history_len:] = samples
+        self._history[:] = extended[num_samples:]
+
+        # windows[n] 是计算第n个输入样本处输出所需的样本窗口（只是视图，不复制）
+        windows = np.lib.stride_tricks.sliding_window_view(
+            extended, self._taps_per_phase
+        )
+
+        # 本块需要输出的样本在上采样序列中的位置：phase, phase+down, ...
+        upsampled_len = num_samples * self.up
+        count = len(range(self._phase, upsampled_len, self.down))
+        if len(self._scratch) < count:
+            self._scratch = np.empty(count, dtype=np.float32)
+        resampled = self._scratch[:count]
+
+        # 每隔up个输出样本相位相同，同一相位的输出用一次矩阵乘法算完
+        for i in range(min(self.up, count)):
+            position = self._phase + i * self.down
+            phase_count = len(range(i, count, self.up))
+            start = position // self.up
+            stop = start + (phase_count - 1) * self.down + 1
+            np.matmul(
+                windows[start : stop : self.down],
+                self._polyphase[position % self.up],
+                out=resampled[i :: self.up],
+            )
+
+        # 记录下一块应从哪个位置开始取样
+        self._phase = (self._phase - upsampled_len) % self.down
+
+        np.clip(resampled, INT16_MIN, INT16_MAX, out=resampled)
+        np.rint(resampled, out=resampled)
+
+        # 写入复用的输出缓冲区（不够大时才重新分配）
+        if len(self._output) < count:
+            self._output = np.empty(count, dtype=np.int16)
+        output = self._output[:count]
+        np.copyto(output, resampled, casting="unsafe")
+        return memoryview(output).cast("B")
+
+
+@functools.lru_cache(maxsize=None)
+def get_local_ips():
+    """
+    🌐 获取本机的局域网IP地址
+
+    返回：
+        tuple: IP地址列表（局域网IP + 127.0.0.1）
+
+    💡 实现说明：
+    - 创建一个UDP socket"连接"到外部地址，再读出本机使用的源地址
+    - UDP的connect不会真正发送数据，也不做DNS解析，不会因为hosts配置异常而卡住
+    - 结果会被缓存，重复调用不会再次访问网络
+    """
+    ips = []
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # 连接到一个外部地址（不会真正发送数据）
+            s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]
+            if not ip.startswith("127."):
+                ips.append(ip)
+        finally:
+            s.close()
+    except OSError as e:
+        print(f"⚠️  获取本机IP地址失败: {e}")
+
+    # 始终添加localhost
+    ips.append("127.0.0.1")
+    return tuple(ips)
+
+
 class WebSocketAudioServer:
     """
     🎙️ WebSocket音频服务器
@@ -130,6 +369,20 @@ class WebSocketAudioServer:
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.response_dir, exist_ok=True)
 
+        # 🔢 文件序号：同一秒内保存多段音频时文件名也不会重复
+        self._file_seq = itertools.count(1)
+
+        # 📋 ESP32控制事件 → 处理方法（每条消息只需一次字典查找）
+        self.event_handlers = {
+            "wake_word_detected": self.handle_wake_word_detected,
+            "recording_started": self.handle_recording_started,
+            "recording_ended": self.handle_recording_ended,
+            "recording_cancelled": self.handle_recording_cancelled,
+        }
+
+        # 💾 录音保存队列：由单个后台任务依次编码保存（在start_server中创建）
+        self.save_queue = None
+
         # 🔑 配置API密钥
         # 初始化Omni Realtime客户端
         # 优先从环境变量获取 API 密钥（推荐方式）
@@ -157,6 +410,9 @@ class WebSocketAudioServer:
             self.use_model = True
             print("✅ 已配置大模型API，将使用AI生成响应音频")
 
+        if not SCIPY_AVAILABLE:
+            print("⚠️  未安装scipy，使用简单重采样方法")
+
     async def handle_client(self, websocket, path):
         """
         🤝 处理客户端连接
@@ -187,11 +443,22 @@ class WebSocketAudioServer:
             "realtime_client": None,  # 大模型客户端实例
             "message_task": None,  # 消息处理任务
             "audio_buffer": bytearray(),  # 音频缓冲区（用于保存录音）
-            "audio_tracker": {  # 音频发送跟踪器
-                "total_sent": 0,  # 已发送的总字节数
-                "last_time": time.time(),  # 最后发送时间
-            },
+            "audio_tracker": self.create_audio_tracker(),  # 音频发送跟踪器
+            "resampler": None,  # 模型音频的流式重采样器（每次对话重新创建）
+            # 📮 模型音频发送缓冲：回调只负责追加，由单个发送任务按顺序发给ESP32
+            "audio_pending": bytearray(),  # 等待发送的模型音频（24kHz）
+            "audio_ready": asyncio.Event(),  # 有新音频或响应结束时通知发送任务
+            "response_ended": False,  # 大模型已发出response.done，缓冲发完后即结束本轮
+            "audio_overflow": False,  # 缓冲已满、正在丢弃音频（缓冲发完后恢复）
+            "sender_task": None,  # 音频发送任务
+            "prewarm_task": None,  # 预热下一次对话所用大模型连接的任务
         }
+        client_state["sender_task"] = asyncio.create_task(
+            self.audio_sender(websocket, client_ip, client_state)
+        )
+
+        # 🔥 连接建立后立即预热大模型连接，用户第一次说话时无需等待握手
+        self.prewarm_realtime_client(client_ip, client_state)
 
         try:
             async for message in websocket:
@@ -204,162 +471,24 @@ class WebSocketAudioServer:
                             client_state["is_recording"]
                             and client_state["realtime_client"]
                         ):
-                            # 保存到缓冲区（用于本地录音文件）
-                            client_state["audio_buffer"].extend(message)
+                            # 保存到缓冲区（用于本地录音文件，关闭录音保存时跳过）
+                            if ARCHIVE_USER_AUDIO:
+                                client_state["audio_buffer"].extend(message)
 
                             # 🚀 实时转发到LLM
-                            # Base64编码是因为WebSocket文本消息需要ASCII字符
-                            encoded_data = base64.b64encode(message).decode("utf-8")
-
-                            # 构建大模型API事件格式
-                            event = {
-                                "event_id": "event_"
-                                + str(int(time.time() * 1000)),  # 唯一事件ID
-                                "type": "input_audio_buffer.append",  # 追加音频数据
-                                "audio": encoded_data,  # Base64编码的音频
-                            }
-
-                            # 异步发送，不阻塞后续音频接收
-                            await client_state["realtime_client"].send_event(event)
-                            print(f"   📤 实时转发音频块: {len(message)} 字节")
+                            # 💡 ESP32每帧音频很小，客户端会攒够一批再Base64编码、
+                            #    JSON封装后发送，减少逐帧发送的固定开销
+                            await client_state["realtime_client"].stream_audio(message)
                         continue
 
                     # 解析JSON消息
-                    data = json.loads(message)
+                    data = json_loads(message)
                     event = data.get("event")
 
-                    if event == "wake_word_detected":
-                        # 🎯 唤醒词检测事件
-                        print(f"🎉 [{client_ip}] 检测到唤醒词！")
-                        # 💡 此时ESP32已经被唤醒，准备接收用户指令
-
-                    elif event == "recording_started":
-                        # 🎙️ 开始录音事件
-                        print(f"🎤 [{client_ip}] 开始录音...")
-                        client_state["is_recording"] = True
-                        client_state["audio_buffer"] = bytearray()
-                        client_state["audio_tracker"] = {
-                            "total_sent": 0,
-                            "last_time": time.time(),
-                        }
-
-                        # 🤖 初始化LLM连接
-                        # 💡 每次录音开始时创建新的大模型连接，确保状态独立
-                        if self.use_model:
-                            try:
-                                # 创建大模型客户端实例
-                                # 📌 关键参数说明：
-                                # - base_url: 阿里云大模型的WebSocket端点
-                                # - model: 使用的模型版本
-                                # - voice: 语音合成的音色
-                                # - on_audio_delta: 音频流回调函数
-                                # - turn_detection_mode: 手动模式，由我们控制何时生成响应
-                                client_state["realtime_client"] = OmniRealtimeClient(
-                                    base_url="wss://dashscope.aliyuncs.com/api-ws/v1/realtime",
-                                    api_key=self.api_key,
-                                    model="qwen-omni-turbo-realtime-2025-05-08",
-                                    voice="Chelsie",
-                                    # 🎵 音频流回调函数
-                                    # 当大模型生成音频片段时，立即转发给ESP32
-                                    # 使用lambda创建异步任务，实现流式传输
-                                    on_audio_delta=lambda audio: asyncio.create_task(
-                                        self.on_audio_delta_handler(
-                                            websocket,
-                                            client_ip,
-                                            audio,
-                                            client_state["audio_tracker"],
-                                        )
-                                    ),
-                                    turn_detection_mode=TurnDetectionMode.MANUAL,
-                                )
-
-                                # 连接到大模型
-                                await client_state["realtime_client"].connect()
-
-                                # 启动消息处理
-                                client_state["message_task"] = asyncio.create_task(
-                                    client_state["realtime_client"].handle_messages()
-                                )
-
-                                print(f"✅ [{client_ip}] LLM连接成功，准备接收实时音频")
-
-                            except Exception as e:
-                                print(f"❌ [{client_ip}] 初始化大模型失败: {e}")
-                                client_state["realtime_client"] = None
-
-                    elif event == "recording_ended":
-                        # 🏁 录音结束事件
-                        print(f"✅ [{client_ip}] 录音结束")
-                        client_state["is_recording"] = False
-
-                        # 💡 录音结束后的处理流程：
-                        # 1. 保存用户录音到本地
-                        # 2. 触发大模型生成响应
-                        # 3. 流式发送响应音频给ESP32
-
-                        # 保存音频
-                        if len(client_state["audio_buffer"]) > 0:
-                            print(
-                                f"📊 [{client_ip}] 音频总大小: {len(client_state['audio_buffer'])} 字节 ({len(client_state['audio_buffer'])/2/SAMPLE_RATE:.2f}秒)"
-                            )
-
-                            # 保存音频
-                            current_timestamp = datetime.now()
-                            saved_file = await self.save_audio(
-                                [bytes(client_state["audio_buffer"])], current_timestamp
-                            )
-                            if saved_file:
-                                print(f"✅ [{client_ip}] 音频已保存: {saved_file}")
-
-                        # 🤖 触发LLM响应生成
-                        if self.use_model and client_state["realtime_client"]:
-                            try:
-                                # 📌 手动触发响应生成
-                                # 因为我们使用MANUAL模式，需要明确告诉大模型开始生成响应
-                                await client_state["realtime_client"].create_response()
-
-                                # ⏳ 等待响应完成（最多30秒）
-                                print(f"🤖 [{client_ip}] 等待模型生成响应...")
-                                max_wait_time = 30  # 超时保护，避免无限等待
-                                start_time = time.time()
-
-                                # 💡 等待策略说明：
-                                # - 每100ms检查一次状态
-                                # - 如果2秒内没有新音频，认为响应结束
-                                # - 最多等待30秒避免超时
-
-                                while time.time() - start_time < max_wait_time:
-                                    await asyncio.sleep(0.1)
-
-                                    # 如果超过2秒没有新的音频数据发送，认为响应结束
-                                    if (
-                                        client_state["audio_tracker"]["total_sent"] > 0
-                                        and time.time()
-                                        - client_state["audio_tracker"]["last_time"]
-                                        > 2.0
-                                    ):
-                                        print(
-                                            f"✅ [{client_ip}] 响应音频发送完成，总计: {client_state['audio_tracker']['total_sent']} 字节"
-                                        )
-                                        break
-
-                                # 如果没有收到任何音频响应，只打印警告
-                                if client_state["audio_tracker"]["total_sent"] == 0:
-                                    print(f"⚠️ [{client_ip}] 未收到大模型响应")
-
-                                # 发送ping作为音频结束标志
-                                await websocket.ping()
-
-                            except Exception as e:
-                                print(f"❌ [{client_ip}] 模型处理失败: {e}")
-                        else:
-                            # 不使用模型时只打印警告
-                            print(f"⚠️ [{client_ip}] 未启用AI模型，无法生成响应")
-
-                    elif event == "recording_cancelled":
-                        print(f"⚠️ [{client_ip}] 录音取消")
-                        client_state["is_recording"] = False
-                        client_state["audio_buffer"] = bytearray()
+                    # 📋 按事件类型分发给对应的处理方法
+                    handler = self.event_handlers.get(event)
+                    if handler:
+                        await handler(websocket, client_ip, client_state)
 
                 except json.JSONDecodeError as e:
                     print(f"❌ [{client_ip}] JSON解析错误: {e}")
@@ -372,16 +501,356 @@ class WebSocketAudioServer:
             print(f"❌ [{client_ip}] 连接错误: {e}")
         finally:
             # 清理资源
-            if client_state["realtime_client"]:
+            sender_task = client_state["sender_task"]
+            sender_task.cancel()
+            if client_state["audio_tracker"]["idle_timer"]:
+                client_state["audio_tracker"]["idle_timer"].cancel()
+
+            prewarm_task = client_state["prewarm_task"]
+            if prewarm_task:
+                if not prewarm_task.done():
+                    prewarm_task.cancel()
+                elif not prewarm_task.cancelled() and not prewarm_task.exception():
+                    await self.close_realtime_client(*prewarm_task.result())
+
+            await self.release_realtime_client(client_state)
+            await asyncio.wait([sender_task], timeout=1.0)
+
+            # 断开引用，尽快释放录音缓冲区
+            client_state["audio_buffer"] = None
+
+    async def handle_wake_word_detected(self, websocket, client_ip, client_state):
+        """🎯 处理唤醒词检测事件"""
+        print(f"🎉 [{client_ip}] 检测到唤醒词！")
+        # 💡 此时ESP32已经被唤醒，准备接收用户指令
+
+    async def handle_recording_started(self, websocket, client_ip, client_state):
+        """🎙️ 处理开始录音事件：重置本轮状态并取用大模型连接"""
+        print(f"🎤 [{client_ip}] 开始录音...")
+        client_state["is_recording"] = True
+        client_state["audio_buffer"] = bytearray()
+        client_state["audio_tracker"] = self.create_audio_tracker()
+        if SCIPY_AVAILABLE:
+            client_state["resampler"] = StreamingResampler(MODEL_SAMPLE_RATE, SAMPLE_RATE)
+
+        # 🤖 初始化LLM连接
+        # 💡 每次录音使用一个新的大模型会话，确保状态独立
+        #    会话通常已在空闲时预热好，这里直接取用
+        if self.use_model:
+            # 上一次对话的会话通常已在结束时关闭，这里再确认一次
+            await self.release_realtime_client(client_state)
+
+            try:
+                (
+                    client_state["realtime_client"],
+                    client_state["message_task"],
+                ) = await self.acquire_realtime_client(client_ip, client_state)
+
+                print(f"✅ [{client_ip}] LLM连接成功，准备接收实时音频")
+
+            except Exception as e:
+                print(f"❌ [{client_ip}] 初始化大模型失败: {e}")
+                client_state["realtime_client"] = None
+
+    async def handle_recording_ended(self, websocket, client_ip, client_state):
+        """🏁 处理录音结束事件：保存录音、触发大模型响应并等待响应音频发送完成"""
+        print(f"✅ [{client_ip}] 录音结束")
+        client_state["is_recording"] = False
+
+        # 💡 录音结束后的处理流程：
+        # 1. 保存用户录音到本地
+        # 2. 触发大模型生成响应
+        # 3. 流式发送响应音频给ESP32
+
+        # 保存音频
+        if len(client_state["audio_buffer"]) > 0:
+            # 💡 直接把缓冲区交给保存函数（不复制），
+            #    本连接换用新的缓冲区，互不影响
+            audio_data = client_state["audio_buffer"]
+            client_state["audio_buffer"] = bytearray()
+            print(
+                f"📊 [{client_ip}] 音频总大小: {len(audio_data)} 字节 ({len(audio_data)/2/SAMPLE_RATE:.2f}秒)"
+            )
+
+            # 保存音频（放入队列，由后台任务编码，不阻塞本轮对话）
+            self.queue_audio_save(client_ip, audio_data, time.time())
+
+        # 🤖 触发LLM响应生成
+        if self.use_model and client_state["realtime_client"]:
+            try:
+                # 把还没攒够一批的剩余音频发出去
+                await client_state["realtime_client"].flush_audio()
+
+                # 📌 手动触发响应生成
+                # 因为我们使用MANUAL模式，需要明确告诉大模型开始生成响应
+                await client_state["realtime_client"].create_response()
+
+                # ⏳ 等待响应完成（最多30秒）
+                print(f"🤖 [{client_ip}] 等待模型生成响应...")
+
+                # 💡 等待策略说明：
+                # - 大模型发出response.done、且之前的音频都已发给ESP32时，立即结束等待
+                #   （没有音频的响应，例如纯文本、出错或被取消的响应，也会结束等待）
+                # - 兜底：每发送一个音频块就重置空闲计时器，2秒内没有新音频也认为响应结束
+                # - 最多等待30秒避免超时
                 try:
-                    if client_state["message_task"]:
-                        client_state["message_task"].cancel()
-                    await client_state["realtime_client"].close()
-                except:
+                    await asyncio.wait_for(
+                        client_state["audio_tracker"]["response_done"].wait(),
+                        timeout=RESPONSE_MAX_WAIT,
+                    )
+                    print(
+                        f"✅ [{client_ip}] 响应音频发送完成，总计: {client_state['audio_tracker']['total_sent']} 字节"
+                    )
+                except asyncio.TimeoutError:
                     pass
 
+                # 如果没有收到任何音频响应，只打印警告
+                if client_state["audio_tracker"]["total_sent"] == 0:
+                    print(f"⚠️ [{client_ip}] 未收到大模型响应")
+
+                # 发送ping作为音频结束标志
+                await websocket.ping()
+
+            except Exception as e:
+                print(f"❌ [{client_ip}] 模型处理失败: {e}")
+
+            # 🔥 本轮对话结束：关闭本轮的会话，再预热下一轮要用的连接
+            # 💡 先关闭再预热，保证每个ESP32同时最多只占用一个大模型会话
+            await self.release_realtime_client(client_state)
+            self.prewarm_realtime_client(client_ip, client_state)
+        else:
+            # 不使用模型时只打印警告
+            print(f"⚠️ [{client_ip}] 未启用AI模型，无法生成响应")
+
+    async def handle_recording_cancelled(self, websocket, client_ip, client_state):
+        """⚠️ 处理录音取消事件"""
+        print(f"⚠️ [{client_ip}] 录音取消")
+        client_state["is_recording"] = False
+        client_state["audio_buffer"] = bytearray()
+        await self.release_realtime_client(client_state)
+        self.prewarm_realtime_client(client_ip, client_state)
+
+    async def connect_realtime_client(self, client_ip, client_state):
+        """
+        🔌 创建并连接一个大模型客户端
+
+        参数：
+            client_ip: 客户端IP地址
+            client_state: 客户端状态（模型音频会追加到其中的发送缓冲）
+
+        返回：
+            tuple: (大模型客户端实例, 消息处理任务)
+        """
+        # 创建大模型客户端实例
+        # 📌 关键参数说明：
+        # - base_url: 阿里云大模型的WebSocket端点
+        # - model: 使用的模型版本
+        # - voice: 语音合成的音色
+        # - on_audio_delta: 音频流回调函数
+        # - turn_detection_mode: 手动模式，由我们控制何时生成响应
+        realtime_client = OmniRealtimeClient(
+            base_url="wss://dashscope.aliyuncs.com/api-ws/v1/realtime",
+            api_key=self.api_key,
+            model="qwen-omni-turbo-realtime-2025-05-08",
+            voice="Chelsie",
+            # 🎵 音频流回调函数
+            # 当大模型生成音频片段时，追加到发送缓冲
+            # 由发送任务按到达顺序转发给ESP32，保证音频不乱序
+            on_audio_delta=lambda audio: self.enqueue_audio(
+                client_ip, client_state, audio
+            ),
+            # 🏁 响应结束回调：记下结束标记，
+            # 发送任务把缓冲中的音频都发给ESP32后，才通知等待方响应已结束
+            on_response_done=lambda: self.end_audio_response(client_state),
+            turn_detection_mode=TurnDetectionMode.MANUAL,
+        )
+
+        # 连接到大模型
+        # ⚠️ 连接中途失败或被取消（例如预热任务在配置会话时被取消）时，
+        #    关闭已经打开的WebSocket，避免连接泄漏
+        try:
+            await realtime_client.connect()
+        except BaseException:
+            await self.close_realtime_client(realtime_client, None)
+            raise
+
+        # 启动消息处理
+        message_task = asyncio.create_task(realtime_client.handle_messages())
+
+        return realtime_client, message_task
+
+    def prewarm_realtime_client(self, client_ip, client_state):
+        """
+        🔥 在后台提前建立下一次对话要用的大模型连接
+
+        💡 为什么要预热：
+        - TLS握手、鉴权和会话配置通常需要几百毫秒
+        - 提前在空闲时完成，用户开始说话时可以直接使用
+        - 每个ESP32连接最多预热一个会话，不会占用额外配额
+        """
+        if self.use_model and client_state["prewarm_task"] is None:
+            client_state["prewarm_task"] = asyncio.create_task(
+                self.connect_realtime_client(client_ip, client_state)
+            )
+
+    async def acquire_realtime_client(self, client_ip, client_state):
+        """
+        🤝 获取一个可用的大模型连接
+
+        优先使用预热好的连接；没有预热或预热的连接已失效时，重新建立连接。
+
+        返回：
+            tuple: (大模型客户端实例, 消息处理任务)
+        """
+        prewarm_task = client_state["prewarm_task"]
+        client_state["prewarm_task"] = None
+
+        if prewarm_task:
+            try:
+                realtime_client, message_task = await prewarm_task
+                if not message_task.done():
+                    return realtime_client, message_task
+
+                # 消息处理已退出，说明连接被服务端关闭（例如空闲超时）
+                await self.close_realtime_client(realtime_client, message_task)
+            except Exception as e:
+                print(f"⚠️ [{client_ip}] 预热的大模型连接不可用，重新连接: {e}")
+
+        return await self.connect_realtime_client(client_ip, client_state)
+
+    async def release_realtime_client(self, client_state):
+        """
+        🔌 关闭本连接正在使用的大模型会话，并清空状态中的引用
+
+        参数：
+            client_state: 客户端状态（realtime_client和message_task会被置为None）
+        """
+        realtime_client = client_state["realtime_client"]
+        message_task = client_state["message_task"]
+        client_state["realtime_client"] = None
+        client_state["message_task"] = None
+        await self.close_realtime_client(realtime_client, message_task)
+
+    async def close_realtime_client(self, realtime_client, message_task):
+        """
+        🔌 关闭大模型连接并停止其消息处理任务
+
+        参数：
+            realtime_client: 大模型客户端实例（可以为None）
+            message_task: 消息处理任务（可以为None）
+        """
+        if message_task:
+            message_task.cancel()
+            # 等待任务真正结束，最多1秒
+            await asyncio.wait([message_task], timeout=1.0)
+        if realtime_client:
+            try:
+                await realtime_client.close()
+            except websockets.exceptions.ConnectionClosed:
+                pass  # 连接已经断开，无需处理
+            except Exception as e:
+                print(f"⚠️  关闭大模型连接失败: {e}")
+
+    def enqueue_audio(self, client_ip, client_state, audio_data):
+        """
+        📥 将模型返回的音频片段追加到发送缓冲
+
+        参数：
+            client_ip: 客户端IP地址
+            client_state: 客户端状态（包含发送缓冲）
+            audio_data: 音频数据（24kHz采样率）
+
+        💡 为什么不直接发送：
+        - 每个片段创建一个Task开销大，且负载高时可能乱序
+        - ESP32按播放速度读取，发送经常要等待，回调不能阻塞大模型消息的接收
+        - 追加到一个连续的缓冲里，发送任务可以按固定大小切块，不受大模型分片方式影响
+
+        ⚠️ 缓冲超过AUDIO_BUFFER_MAX_BYTES时丢弃新到的音频，只会发生在ESP32卡死时
+        """
+        audio_pending = client_state["audio_pending"]
+        if len(audio_pending) + len(audio_data) > AUDIO_BUFFER_MAX_BYTES:
+            if not client_state["audio_overflow"]:
+                client_state["audio_overflow"] = True
+                print(
+                    f"⚠️ [{client_ip}] 音频发送缓冲已满（{AUDIO_BUFFER_MAX_SECONDS}秒），"
+                    f"ESP32可能已停止读取，丢弃后续音频"
+                )
+            return
+        audio_pending += audio_data
+        client_state["audio_ready"].set()
+
+    def end_audio_response(self, client_state):
+        """🏁 标记大模型响应已结束，发送任务发完缓冲中的音频后通知等待方"""
+        client_state["response_ended"] = True
+        client_state["audio_ready"].set()
+
+    async def audio_sender(self, websocket, client_ip, client_state):
+        """
+        📮 音频发送任务
+
+        每个连接只有一个发送任务，从发送缓冲中按顺序取出音频，
+        每次最多AUDIO_BATCH_BYTES字节，重采样后发送给ESP32。
+        缓冲发完且大模型响应已结束时，通知等待方响应已结束。
+
+        ⚠️ 正常情况下音频从不丢弃：ESP32读得慢时send会等待（TCP背压），
+        音频在缓冲中延后发送。只有一次发送超过AUDIO_SEND_STALL_TIMEOUT秒
+        毫无进展时，才认为ESP32已卡死，丢弃剩余音频并断开连接。
+
+        参数：
+            websocket: WebSocket连接对象
+            client_ip: 客户端IP地址
+            client_state: 客户端状态（包含发送缓冲和发送跟踪器）
+        """
+        audio_pending = client_state["audio_pending"]
+        audio_ready = client_state["audio_ready"]
+        while True:
+            await audio_ready.wait()
+            audio_ready.clear()
+
+            # 💡 积压的音频按批发送：重采样的固定开销远大于数据量本身，
+            # 攒成一批再处理可以大幅减少numpy调用次数
+            while audio_pending:
+                audio_data = audio_pending[:AUDIO_BATCH_BYTES]
+                del audio_pending[:AUDIO_BATCH_BYTES]
+                try:
+                    await asyncio.wait_for(
+                        self.on_audio_delta_handler(
+                            websocket,
+                            client_ip,
+                            audio_data,
+                            client_state["audio_tracker"],
+                            client_state["resampler"],
+                        ),
+                        timeout=AUDIO_SEND_STALL_TIMEOUT,
+                    )
+                except asyncio.TimeoutError:
+                    print(
+                        f"❌ [{client_ip}] 发送音频{AUDIO_SEND_STALL_TIMEOUT}秒无进展，"
+                        f"ESP32可能已卡死，丢弃 {len(audio_pending)} 字节音频并断开连接"
+                    )
+                    audio_pending.clear()
+                    await websocket.close()
+                    return
+
+            client_state["audio_overflow"] = False
+            if client_state["response_ended"]:
+                client_state["response_ended"] = False
+                self.finish_response(client_state["audio_tracker"])
+
+    def finish_response(self, audio_tracker):
+        """
+        🏁 标记响应音频已全部发送，通知等待方不必再等空闲计时器
+
+        参数：
+            audio_tracker: 音频发送跟踪器
+        """
+        if audio_tracker["idle_timer"]:
+            audio_tracker["idle_timer"].cancel()
+            audio_tracker["idle_timer"] = None
+        audio_tracker["response_done"].set()
+
     async def on_audio_delta_handler(
-        self, websocket, client_ip, audio_data, audio_tracker
+        self, websocket, client_ip, audio_data, audio_tracker, resampler=None
     ):
         """
         🎵 处理模型返回的音频片段
@@ -393,6 +862,7 @@ class WebSocketAudioServer:
             client_ip: 客户端IP地址
             audio_data: 音频数据（24kHz采样率）
             audio_tracker: 音频发送跟踪器
+            resampler: 流式重采样器（未安装scipy时为None，改用resample_audio线性插值）
 
         主要工作：
             1. 音频重采样（24kHz → 16kHz）
@@ -408,75 +878,135 @@ class WebSocketAudioServer:
             # 🔄 音频重采样
             # 大模型输出24kHz，ESP32需要16kHz
             # 必须转换采样率，否则播放速度会不正确
-            resampled = self.resample_audio(audio_data, MODEL_SAMPLE_RATE, SAMPLE_RATE)
+            if resampler:
+                resampled = resampler.process(audio_data)
+            else:
+                resampled = self.resample_audio(
+                    audio_data, MODEL_SAMPLE_RATE, SAMPLE_RATE
+                )
+
+            # 不足一个完整样本时没有可发送的数据
+            if len(resampled) == 0:
+                return
 
             # 立即发送到ESP32
             await websocket.send(resampled)
-            print(f"   → 流式发送音频块: {len(resampled)} 字节")
+            logger.debug("   → 流式发送音频块: %d 字节", len(resampled))
 
             # 更新音频跟踪信息
             audio_tracker["total_sent"] += len(resampled)
-            audio_tracker["last_time"] = time.time()
+
+            # 重置空闲计时器（兜底）：正常情况下由response.done结束等待，
+            # 如果一直收不到，2秒内没有新音频也通知等待方响应已结束
+            if audio_tracker["idle_timer"]:
+                audio_tracker["idle_timer"].cancel()
+            audio_tracker["idle_timer"] = asyncio.get_running_loop().call_later(
+                RESPONSE_IDLE_TIMEOUT, audio_tracker["response_done"].set
+            )
 
         except Exception as e:
             print(f"❌ [{client_ip}] 发送音频块失败: {e}")
 
-    async def save_audio(self, audio_buffer, timestamp):
+    def create_audio_tracker(self):
+        """
+        📊 创建音频发送跟踪器
+
+        - total_sent: 已发送的总字节数
+        - response_done: 响应音频发送完成时被设置的事件
+          （收到大模型的response.done并发完之前的音频时设置，空闲计时器到期时兜底设置）
+        - idle_timer: 空闲计时器，每收到一个音频块就重新计时
+        """
+        return {"total_sent": 0, "response_done": asyncio.Event(), "idle_timer": None}
+
+    def make_file_stem(self, directory, prefix, timestamp=None):
+        """
+        📝 生成音频文件路径（不含扩展名）
+
+        参数：
+            directory: 保存目录
+            prefix: 文件名前缀（如recording、response）
+            timestamp: 时间戳（time.time()的返回值，为None时使用当前时间）
+
+        返回：
+            str: 形如 recording_20250101_120000_1 的路径
+
+        💡 时间只格式化一次，末尾的序号保证文件名不会重复
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        timestamp_str = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
+        return os.path.join(
+            directory, f"{prefix}_{timestamp_str}_{next(self._file_seq)}"
+        )
+
+    def queue_audio_save(self, client_ip, audio_data, timestamp):
+        """
+        📥 把录音放入保存队列
+
+        💡 队列满时直接丢弃这段录音（只打印警告），
+        避免大量MP3编码同时进行、抢占实时音频的CPU
+        """
+        try:
+            self.save_queue.put_nowait((client_ip, audio_data, timestamp))
+        except asyncio.QueueFull:
+            print(f"⚠️ [{client_ip}] 保存队列已满，丢弃本段录音")
+
+    async def save_worker(self):
+        """
+        💾 录音保存任务
+
+        从保存队列中依次取出录音并保存，同一时间最多只有一个MP3编码在进行
+        """
+        while True:
+            client_ip, audio_data, timestamp = await self.save_queue.get()
+            try:
+                saved_file = await self.save_audio(audio_data, timestamp)
+                if saved_file:
+                    print(f"✅ [{client_ip}] 音频已保存: {saved_file}")
+            finally:
+                self.save_queue.task_done()
+
+    async def save_audio(self, audio_data, timestamp):
         """
         💾 保存音频数据为MP3文件
 
         参数：
-            audio_buffer: 音频数据列表
-            timestamp: 时间戳
+            audio_data: 16位PCM音频数据（bytes或bytearray）
+            timestamp: 时间戳（time.time()的返回值，为None时使用当前时间）
 
         返回：
             str: 保存的文件路径，失败返回None
 
         功能：
-            1. 合并音频数据
-            2. 保存为WAV格式
-            3. 转换为MP3格式（节省空间）
-            4. 删除临时WAV文件
+            编码为MP3（节省空间，不产生临时WAV文件），优先使用lameenc，否则交给ffmpeg
 
         💡 为什么保存音频：
         - 调试和分析
         - 训练自定义模型
         - 用户隐私合规记录
+
+        ⚡ MP3编码和文件写入都是阻塞操作，放到线程池中执行，
+        避免卡住事件循环、影响其他连接的实时音频
         """
-        if not audio_buffer:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._save_audio_sync, audio_data, timestamp
+        )
+
+    def _save_audio_sync(self, audio_data, timestamp):
+        """save_audio的同步实现（在线程池中运行）"""
+        if not audio_data:
             print("⚠️  没有音频数据可保存")
             return None
 
         try:
-            # 合并所有音频数据
-            audio_data = b"".join(audio_buffer)
-
             # 生成文件名
-            timestamp_str = (
-                timestamp.strftime("%Y%m%d_%H%M%S")
-                if timestamp
-                else datetime.now().strftime("%Y%m%d_%H%M%S")
-            )
-            wav_filename = os.path.join(
-                self.output_dir, f"recording_{timestamp_str}.wav"
+            mp3_filename = (
+                self.make_file_stem(self.output_dir, "recording", timestamp) + ".mp3"
             )
-            mp3_filename = os.path.join(
-                self.output_dir, f"recording_{timestamp_str}.mp3"
-            )
-
-            # 保存为WAV文件
-            with wave.open(wav_filename, "wb") as wav_file:
-                wav_file.setnchannels(CHANNELS)
-                wav_file.setsampwidth(BIT_DEPTH // 8)
-                wav_file.setframerate(SAMPLE_RATE)
-                wav_file.writeframes(audio_data)
-
-            # 转换为MP3
-            audio = AudioSegment.from_wav(wav_filename)
-            audio.export(mp3_filename, format="mp3", bitrate="128k")
 
-            # 删除临时WAV文件
-            os.remove(wav_filename)
+            # 编码为MP3
+            self.encode_mp3(audio_data, mp3_filename, SAMPLE_RATE)
 
             # 显示音频信息
             duration = len(audio_data) / BYTES_PER_SAMPLE / SAMPLE_RATE
@@ -493,38 +1023,26 @@ class WebSocketAudioServer:
     async def save_response_audio(
         self, audio_data, timestamp, sample_rate=MODEL_SAMPLE_RATE
     ):
-        """保存响应音频数据为MP3文件"""
+        """保存响应音频数据为MP3文件（在线程池中执行，不阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._save_response_audio_sync, audio_data, timestamp, sample_rate
+        )
+
+    def _save_response_audio_sync(self, audio_data, timestamp, sample_rate):
+        """save_response_audio的同步实现（在线程池中运行）"""
         if not audio_data:
             print("⚠️  没有响应音频数据可保存")
             return None
 
         try:
             # 生成文件名
-            timestamp_str = (
-                timestamp.strftime("%Y%m%d_%H%M%S")
-                if timestamp
-                else datetime.now().strftime("%Y%m%d_%H%M%S")
+            mp3_filename = (
+                self.make_file_stem(self.response_dir, "response", timestamp) + ".mp3"
             )
-            wav_filename = os.path.join(
-                self.response_dir, f"response_{timestamp_str}.wav"
-            )
-            mp3_filename = os.path.join(
-                self.response_dir, f"response_{timestamp_str}.mp3"
-            )
-
-            # 保存为WAV文件（使用正确的采样率）
-            with wave.open(wav_filename, "wb") as wav_file:
-                wav_file.setnchannels(CHANNELS)
-                wav_file.setsampwidth(BIT_DEPTH // 8)
-                wav_file.setframerate(sample_rate)  # 使用传入的采样率
-                wav_file.writeframes(audio_data)
 
-            # 转换为MP3
-            audio = AudioSegment.from_wav(wav_filename)
-            audio.export(mp3_filename, format="mp3", bitrate="128k")
-
-            # 删除临时WAV文件
-            os.remove(wav_filename)
+            # 编码为MP3（使用正确的采样率）
+            self.encode_mp3(audio_data, mp3_filename, sample_rate)
 
             # 显示音频信息
             duration = len(audio_data) / BYTES_PER_SAMPLE / sample_rate
@@ -539,9 +1057,54 @@ class WebSocketAudioServer:
             print(f"\n❌ 保存响应音频失败: {e}")
             return None
 
+    def encode_mp3(self, audio_data, mp3_filename, sample_rate):
+        """
+        🎼 将16位PCM音频编码为MP3文件
+
+        参数：
+            audio_data: 16位PCM音频数据（字节）
+            mp3_filename: 输出的MP3文件路径
+            sample_rate: 音频采样率（Hz）
+
+        💡 安装了lameenc时直接在进程内编码，不需要启动任何子进程；
+        否则PCM数据通过标准输入直接交给ffmpeg，不需要先写临时WAV文件再读回来
+        """
+        if LAMEENC_AVAILABLE:
+            encoder = lameenc.Encoder()
+            encoder.set_bit_rate(128)
+            encoder.set_in_sample_rate(sample_rate)
+            encoder.set_channels(CHANNELS)
+            encoder.set_quality(2)
+            # lameenc只接受只读的bytes
+            mp3_data = encoder.encode(bytes(audio_data)) + encoder.flush()
+            with open(mp3_filename, "wb") as f:
+                f.write(mp3_data)
+            return
+
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-y",  # 覆盖已存在的文件
+                "-f", "s16le",  # 输入格式：16位小端PCM
+                "-ar", str(sample_rate),
+                "-ac", str(CHANNELS),
+                "-i", "pipe:0",  # 从标准输入读取
+                "-codec:a", "libmp3lame",
+                "-b:a", "128k",
+                mp3_filename,
+            ],
+            input=audio_data,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg编码失败: {result.stderr.decode('utf-8', 'ignore').strip()}"
+            )
+
     def resample_audio(self, audio_data, from_rate, to_rate):
         """
-        🔄 重采样音频数据
+        🔄 重采样音频数据（未安装scipy时使用的简单实现）
 
         参数：
             audio_data: 原始音频数据（字节）
@@ -551,9 +1114,8 @@ class WebSocketAudioServer:
         返回：
             bytes: 重采样后的音频数据
 
-        算法说明：
-            1. 优先使用scipy的高质量重采样
-            2. 如果scipy不可用，使用简单的线性插值
+        💡 安装了scipy时，模型音频全部由StreamingResampler处理，
+        只有未安装scipy时才会用到这里的线性插值
 
         💡 采样率转换原理：
         - 采样率决定每秒采集多少个音频样本
@@ -561,123 +1123,25 @@ class WebSocketAudioServer:
         - 使用插值算法保持音频质量
 
         ⚠️ 注意事项：
-        - 重采样可能引入少量失真
+        - 线性插值没有抗混叠滤波，音质不如scipy的多相滤波
         - 对语音识别影响较小
         """
         if from_rate == to_rate:
             return audio_data
 
-        try:
-            import numpy as np
-            from scipy import signal
-
-            # 将字节数据转换为numpy数组
-            audio_array = np.frombuffer(audio_data, dtype=np.int16)
-
-            # 计算重采样后的长度
-            num_samples = int(len(audio_array) * to_rate / from_rate)
-
-            # 使用scipy进行重采样
-            resampled = signal.resample(audio_array, num_samples)
+        # 💡 用numpy向量化计算，避免逐个样本的Python循环
+        audio_array = np.frombuffer(audio_data, dtype=np.int16)
 
-            # 转换回int16
-            resampled = np.clip(resampled, -32768, 32767).astype(np.int16)
+        # 每个输出样本对应的原始样本位置（可能落在两个样本之间）
+        num_samples = int(len(audio_array) * to_rate / from_rate)
+        src_positions = np.arange(num_samples) * (from_rate / to_rate)
 
-            # 转换回字节数据
-            return resampled.tobytes()
+        # 线性插值（超出末尾的位置取最后一个样本）
+        resampled = np.interp(src_positions, np.arange(len(audio_array)), audio_array)
+        np.rint(resampled, out=resampled)
 
-        except ImportError:
-            # 如果没有安装scipy，使用简单的线性插值
-            print("⚠️  未安装scipy，使用简单重采样方法")
-
-            # 将字节数据转换为16位整数数组
-            audio_array = []
-            for i in range(0, len(audio_data), 2):
-                if i + 1 < len(audio_data):
-                    sample = int.from_bytes(
-                        audio_data[i : i + 2], byteorder="little", signed=True
-                    )
-                    audio_array.append(sample)
-
-            # 简单的重采样
-            ratio = to_rate / from_rate
-            resampled = []
-            for i in range(int(len(audio_array) * ratio)):
-                src_idx = i / ratio
-                src_idx_int = int(src_idx)
-                src_idx_frac = src_idx - src_idx_int
-
-                if src_idx_int + 1 < len(audio_array):
-                    # 线性插值
-                    sample = int(
-                        audio_array[src_idx_int] * (1 - src_idx_frac)
-                        + audio_array[src_idx_int + 1] * src_idx_frac
-                    )
-                else:
-                    sample = audio_array[min(src_idx_int, len(audio_array) - 1)]
-
-                resampled.append(sample)
-
-            # 转换回字节数据
-            result = bytearray()
-            for sample in resampled:
-                result.extend(sample.to_bytes(2, byteorder="little", signed=True))
-
-            return bytes(result)
-
-    def get_local_ips(self):
-        """
-        🌐 获取本机所有可用的IP地址
-
-        返回：
-            list: IP地址列表
-
-        功能：
-            1. 获取所有网络接口的IP
-            2. 过滤掉回环地址
-            3. 支持多网卡环境
-
-        💡 使用场景：
-        - ESP32需要知道服务器的局域网IP
-        - 在路由器后面时，使用内网IP
-        - 支持有线和无线网络
-        """
-        ips = []
-        try:
-            # 获取主机名
-            hostname = socket.gethostname()
-
-            # 获取所有网络接口的IP地址
-            for info in socket.getaddrinfo(hostname, None):
-                # 只获取IPv4地址
-                if info[0] == socket.AF_INET:
-                    ip = info[4][0]
-                    if ip not in ips and not ip.startswith("127."):
-                        ips.append(ip)
-
-            # 如果上面的方法没有获取到IP，尝试另一种方法
-            if not ips:
-                # 创建一个UDP socket来获取本机IP
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                try:
-                    # 连接到一个外部地址（不会真正发送数据）
-                    s.connect(("8.8.8.8", 80))
-                    ip = s.getsockname()[0]
-                    if ip not in ips and not ip.startswith("127."):
-                        ips.append(ip)
-                except:
-                    pass
-                finally:
-                    s.close()
-
-            # 始终添加localhost
-            ips.append("127.0.0.1")
-
-        except Exception as e:
-            print(f"⚠️  获取本机IP地址失败: {e}")
-            ips = ["127.0.0.1"]
-
-        return ips
+        # 转换回字节数据
+        return resampled.astype(np.int16).tobytes()
 
     async def start_server(self):
         """
@@ -699,7 +1163,10 @@ class WebSocketAudioServer:
         print("=" * 60)
 
         # 获取所有可用的IP地址
-        local_ips = self.get_local_ips()
+        # 💡 放到线程池里执行，即使网络异常也不会阻塞事件循环
+        local_ips = await asyncio.get_running_loop().run_in_executor(
+            None, get_local_ips
+        )
         print("可用的连接地址:")
         for ip in local_ips:
             print(f"  - ws://{ip}:{WS_PORT}")
@@ -710,12 +1177,30 @@ class WebSocketAudioServer:
         else:
             print(f"\n响应模式: 未启用（需要设置 DASHSCOPE_API_KEY）")
             print(f"提示: 设置环境变量 DASHSCOPE_API_KEY 以启用AI响应")
+        if not ARCHIVE_USER_AUDIO:
+            print(f"录音保存: 已关闭（XZ_ARCHIVE=0）")
         print("=" * 60)
         print("\n等待ESP32连接...\n")
 
+        # 💾 启动录音保存任务
+        self.save_queue = asyncio.Queue(maxsize=SAVE_QUEUE_SIZE)
+        save_task = asyncio.create_task(self.save_worker())
+
         # 创建WebSocket服务器
-        async with websockets.serve(self.handle_client, WS_HOST, WS_PORT):
-            await asyncio.Future()  # 永远运行
+        # 💡 PCM音频几乎无法压缩，关闭permessage-deflate避免每帧白白做一次zlib
+        async with websockets.serve(
+            self.handle_client,
+            WS_HOST,
+            WS_PORT,
+            compression=None,
+            max_size=WS_MAX_MESSAGE_SIZE,
+            max_queue=WS_MAX_QUEUE,
+            write_limit=WS_WRITE_LIMIT,
+        ):
+            try:
+                await asyncio.Future()  # 永远运行
+            finally:
+                save_task.cancel()
 
 
 def main():
@@ -732,11 +1217,24 @@ def main():
     - 事件循环管理所有异步任务
     - 支持高并发连接处理
     """
+    # 📝 默认INFO级别，需要查看逐块音频日志时改为logging.DEBUG
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # websockets自己的INFO日志（监听地址、每个连接的打开/关闭）不输出，只保留警告和错误
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+
     server = WebSocketAudioServer()
 
     try:
         # 🏃 运行服务器
-        asyncio.run(server.start_server())
+        # ⚡ 安装了uvloop时使用uvloop事件循环，WebSocket收发更快
+        # Windows不支持uvloop，会自动使用默认事件循环
+        if UVLOOP_AVAILABLE and sys.version_info >= (3, 11):
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                runner.run(server.start_server())
+        else:
+            if UVLOOP_AVAILABLE:
+                uvloop.install()  # Python 3.11以下通过事件循环策略替换
+            asyncio.run(server.start_server())
     except KeyboardInterrupt:
         # 👋 优雅退出
         print("\n\n⚠️  服务器已停止")